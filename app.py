@@ -1,8 +1,30 @@
 # ---------------- IMPORTS ----------------
 import os
+import cProfile
+import csv
+import fcntl
+import gzip
+import hashlib
+import io
+import json
+import math
+import mimetypes
+import pstats
+import random
 import requests
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import unicodedata
 import uuid
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime, timedelta
 
 # -------- AUTH IMPORTS --------
@@ -17,10 +39,11 @@ from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
     jwt_required,
-    get_jwt_identity
+    get_jwt_identity,
+    verify_jwt_in_request
 )
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session, stream_with_context, g, has_request_context
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 import pandas as pd
@@ -34,9 +57,11 @@ except ImportError:
 
 from PIL import Image
 from deep_translator import GoogleTranslator
+import deep_translator.google
 import google.generativeai as genai
 from dotenv import load_dotenv
 from supabase import create_client
+from supabase.lib.client_options import ClientOptions
 
 YOLO = None
 disease_model = None
@@ -67,16 +92,282 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("❌ Supabase credentials not loaded. Check your .env file!")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", 5))
+supabase = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT))
 
 # ------------------- Google Gemini -------------------
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY 
 chat_model = genai.GenerativeModel("models/gemini-2.5-flash")
 
+# ---------------- EXTERNAL SERVICES ----------------
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET", 25))        # seconds a request may spend on upstream calls
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))       # consecutive failures before opening
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", 30))          # seconds open before a half-open probe
+DEFERRED_WRITES_MAX = int(os.getenv("DEFERRED_WRITES_MAX", 1000))
+TIMEOUT_THREADS = 8
+timeout_executor = ThreadPoolExecutor(max_workers=TIMEOUT_THREADS, thread_name_prefix="upstream")
+timeout_slots = threading.BoundedSemaphore(TIMEOUT_THREADS)  # held until the call really returns
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+@app.before_request
+def start_request_budget():
+    g.deadline = time.monotonic() + REQUEST_BUDGET
+
+
+def remaining_budget():
+    if has_request_context() and "deadline" in g:
+        return g.deadline - time.monotonic()
+    return float("inf")
+
+
+def run_with_timeout(fn, timeout):
+    """
+    Run a call that has no timeout option of its own; the caller stops waiting after `timeout`.
+    The thread keeps running until fn returns, so when every thread is still busy with
+    abandoned calls this fails at once instead of queueing behind them.
+    """
+    if not timeout_slots.acquire(blocking=False):
+        raise TimeoutError("all upstream threads are busy")
+    future = timeout_executor.submit(fn)
+    future.add_done_callback(lambda f: timeout_slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        raise TimeoutError(f"call exceeded {timeout:.1f}s")
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open -> half-open after
+    `reset_timeout`, letting a single probe through; the probe closes or re-opens it.
+    Each call gets min(per-call timeout, remaining request budget) and fails fast when open.
+    """
+
+    def __init__(self, name, timeout, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.counts = Counter()
+        self.last_error = None
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.counts["success"] += 1
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+            self.state = "closed"
+
+    def record_failure(self, error):
+        with self.lock:
+            self.counts["failure"] += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"⚡ Circuit '{self.name}' opened: {self.last_error}")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+    def call(self, fn, timeout=None):
+        """Call fn(timeout) through the breaker. Raises CircuitOpen instead of calling when open or out of budget."""
+        timeout = min(timeout or self.timeout, remaining_budget())
+        if timeout <= 0:
+            with self.lock:
+                self.counts["out_of_budget"] += 1
+            raise CircuitOpen(f"{self.name}: request deadline exceeded")
+        if not self.allow():
+            with self.lock:
+                self.counts["rejected"] += 1
+            raise CircuitOpen(f"{self.name}: circuit open")
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                **self.counts,
+            }
+
+
+gemini_breaker = CircuitBreaker("gemini", timeout=float(os.getenv("GEMINI_TIMEOUT", 20)))
+translator_breaker = CircuitBreaker("translator", timeout=float(os.getenv("TRANSLATOR_TIMEOUT", 5)))
+weather_breaker = CircuitBreaker("visual_crossing", timeout=float(os.getenv("WEATHER_TIMEOUT", 10)))
+supabase_breaker = CircuitBreaker("supabase", timeout=SUPABASE_TIMEOUT)
+breakers = [gemini_breaker, translator_breaker, weather_breaker, supabase_breaker]
+
+class DeadlineSession:
+    """Wraps postgrest's shared httpx client so one query is sent with its own timeout."""
+
+    def __init__(self, session, timeout):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        return self.session.request(*args, timeout=self.timeout, **kwargs)
+
+
+def execute_within(query, timeout):
+    """execute() a postgrest query with `timeout` instead of the client-wide SUPABASE_TIMEOUT."""
+    query.session = DeadlineSession(query.session, timeout)
+    return query.execute()
+
+
+deferred_writes = deque()  # (table, row) inserts waiting for Supabase, oldest first
+deferred_writes_lock = threading.Lock()
+deferred_stats = Counter()  # "deferred", "written", "dropped"
+deferred_flusher = None
+
+
+def flush_deferred_writes():
+    while True:
+        time.sleep(BREAKER_RESET)
+        while True:
+            with deferred_writes_lock:
+                if not deferred_writes:
+                    break
+                table, row = deferred_writes.popleft()
+            try:
+                supabase_breaker.call(lambda t: execute_within(supabase.table(table).insert(row), t))
+            except Exception as e:
+                with deferred_writes_lock:
+                    deferred_writes.appendleft((table, row))
+                    pending = len(deferred_writes)
+                print(f"⏳ {pending} deferred writes still pending: {e}")
+                break
+            with deferred_writes_lock:
+                deferred_stats["written"] += 1
+
+
+def db_insert(table, row):
+    """Insert a history row; if Supabase is failing, queue it and retry in the background."""
+    global deferred_flusher
+    try:
+        return supabase_breaker.call(lambda t: execute_within(supabase.table(table).insert(row), t))
+    except Exception as e:
+        print(f"⚠️ Deferring write to {table}: {e}")
+        with deferred_writes_lock:
+            if len(deferred_writes) >= DEFERRED_WRITES_MAX:
+                dropped_table, _ = deferred_writes.popleft()
+                deferred_stats["dropped"] += 1
+                print(f"❌ Deferred write queue full, dropped oldest row for {dropped_table} "
+                      f"({deferred_stats['dropped']} dropped so far)")
+            deferred_writes.append((table, row))
+            deferred_stats["deferred"] += 1
+            if deferred_flusher is None:
+                deferred_flusher = threading.Thread(target=flush_deferred_writes, name="deferred-writes", daemon=True)
+                deferred_flusher.start()
+        return None
+
 # ---------------- FLASK CONFIG ----------------
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600  # un-fingerprinted static files and uploads
+
+# ---------------- STATIC ASSETS & HTTP CACHING ----------------
+# static/dist is produced by build_assets.py; without it assets are served as before.
+ASSET_MANIFEST = os.path.join(app.static_folder, "dist", "manifest.json")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESS_MIN_BYTES = 1024
+asset_manifest = {"assets": {}, "encodings": {}, "webp": {}}
+if os.path.exists(ASSET_MANIFEST):
+    with open(ASSET_MANIFEST) as f:
+        asset_manifest.update(json.load(f))
+    print(f"📦 Serving {len(asset_manifest['assets'])} fingerprinted static assets")
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == "static":
+        fingerprinted = asset_manifest["assets"].get(values.get("filename"))
+        if fingerprinted:
+            values["filename"] = fingerprinted
+
+
+def serve_static(filename):
+    """Static view: fingerprinted files are cached forever and served as WebP / br / gzip when accepted."""
+    if not filename.startswith("dist/"):
+        return send_from_directory(app.static_folder, filename)
+
+    served, headers = filename, {}
+    mimetype = mimetypes.guess_type(filename)[0]
+    webp = asset_manifest["webp"].get(filename)
+    encodings = asset_manifest["encodings"].get(filename, [])
+    if webp:
+        headers["Vary"] = "Accept"
+        if "image/webp" in request.headers.get("Accept", ""):
+            served, mimetype = webp, "image/webp"
+    elif encodings:
+        headers["Vary"] = "Accept-Encoding"
+        for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in encodings and request.accept_encodings[encoding]:
+                served = filename + ext
+                headers["Content-Encoding"] = encoding
+                break
+
+    response = send_from_directory(app.static_folder, served, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    response.headers.update(headers)
+    return response
+
+
+app.view_functions["static"] = serve_static
+
+
+@app.after_request
+def compress_and_validate(response):
+    """gzip HTML/JSON responses, and give GET JSON an ETag so clients can revalidate with a 304."""
+    if request.endpoint == "static" or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code != 200 or response.mimetype not in ("text/html", "application/json"):
+        return response
+
+    # The body may differ by Accept-Encoding even when this one isn't compressed
+    response.vary.add("Accept-Encoding")
+    if (
+        "Content-Encoding" not in response.headers
+        and request.accept_encodings["gzip"]
+        and response.content_length is not None
+        and response.content_length >= COMPRESS_MIN_BYTES
+    ):
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6, mtime=0))
+        response.headers["Content-Encoding"] = "gzip"
+
+    if response.mimetype == "application/json" and request.method == "GET":
+        response.headers.setdefault("Cache-Control", "private, no-cache")
+        response.add_etag()
+        response.make_conditional(request)
+    return response
 
 # ---------------- LOGIN MANAGER ----------------
 login_manager = LoginManager()
@@ -84,40 +375,548 @@ login_manager.init_app(app)
 login_manager.login_view = "login"
 
 
+# ---------------- RATE LIMITING ----------------
+# State lives in a local SQLite file / lock files so all gunicorn workers on the host share it.
+RATE_LIMIT_DIR = os.getenv("RATE_LIMIT_DIR", os.path.join(tempfile.gettempdir(), "agrismart_limits"))
+DISEASE_RATE_PER_MIN = float(os.getenv("DISEASE_RATE_PER_MIN", 6))
+DISEASE_BURST = int(os.getenv("DISEASE_BURST", 3))
+CHAT_RATE_PER_MIN = float(os.getenv("CHAT_RATE_PER_MIN", 20))
+CHAT_BURST = int(os.getenv("CHAT_BURST", 5))
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", 2))  # YOLO runs at once, across workers
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))              # Gemini calls at once, across workers
+ADMISSION_WAIT = float(os.getenv("ADMISSION_WAIT", 2))              # seconds to queue for a free slot
+os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by endpoint and user, stored in SQLite so limits hold across processes."""
+
+    def __init__(self, path):
+        self.path = path
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        finally:
+            db.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def acquire(self, key, rate, burst):
+        """Take one token. Returns 0 if allowed, otherwise the seconds until a token is available."""
+        now = time.time()
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            db.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            db.execute("COMMIT")
+            return wait
+        finally:
+            db.close()
+
+
+class ConcurrencySlots:
+    """At most `limit` holders across all workers, using one flock()ed file per slot."""
+
+    def __init__(self, name, limit, lock_dir=RATE_LIMIT_DIR):
+        self.name = name
+        self.paths = [os.path.join(lock_dir, f"{name}.{i}.lock") for i in range(limit)]
+
+    def try_acquire(self):
+        for path in self.paths:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @contextmanager
+    def acquire(self, wait=ADMISSION_WAIT):
+        deadline = time.monotonic() + wait
+        fd = self.try_acquire()
+        while fd is None:
+            if time.monotonic() >= deadline:
+                raise RateLimitExceeded(f"Server busy ({self.name}), please retry shortly.", retry_after=1)
+            time.sleep(0.05)
+            fd = self.try_acquire()
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+rate_limiter = TokenBucketLimiter(os.path.join(RATE_LIMIT_DIR, "buckets.sqlite3"))
+inference_slots = ConcurrencySlots("inference", INFERENCE_CONCURRENCY)
+llm_slots = ConcurrencySlots("llm", LLM_CONCURRENCY)
+
+
+def client_identity():
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    try:
+        if verify_jwt_in_request(optional=True):
+            return f"user:{get_jwt_identity()}"
+    except Exception:
+        pass
+    return f"ip:{request.remote_addr}"
+
+
+def rate_limited(endpoint, rate_per_min, burst):
+    """Per-user token bucket for the POST side of an expensive endpoint."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == "POST":
+                try:
+                    wait = rate_limiter.acquire(f"{endpoint}:{client_identity()}", rate_per_min / 60, burst)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Rate limiter unavailable, allowing request: {e}")
+                    wait = 0
+                if wait:
+                    raise RateLimitExceeded("Too many requests, please slow down.", retry_after=wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wants_json():
+    return (
+        request.is_json
+        or request.path.startswith("/api/")
+        or request.headers.get("X-Requested-With") == "XMLHttpRequest"
+        or request.accept_mimetypes.best == "application/json"
+    )
+
+
+@app.errorhandler(RateLimitExceeded)
+def handle_rate_limit(e):
+    retry_after = math.ceil(e.retry_after)
+    if wants_json():
+        response = jsonify({"error": e.message, "retry_after": retry_after})
+        response.status_code = 429
+    else:
+        # Browser form post: back to the form with a message instead of a raw JSON page
+        flash(f"{e.message} Try again in {retry_after} second(s).", "danger")
+        response = redirect(request.url)
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+# ---------------- PROFILING ----------------
+# Off by default: with nothing armed the only per-request cost is one `is None` check,
+# and the slow-request watchdog is not even registered unless SLOW_REQUEST_SECONDS is set.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_SIGNAL_ROUTE = os.getenv("PROFILE_SIGNAL_ROUTE", "*")          # what `kill -USR2 <worker pid>` profiles
+PROFILE_SIGNAL_REQUESTS = int(os.getenv("PROFILE_SIGNAL_REQUESTS", 20))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", 60))
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))    # 0 disables the slow-request logger
+
+
+def frame_stack(frame):
+    """Frames from outermost to innermost as 'func (file.py:line)' strings."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return stack[::-1]
+
+
+class ProfileSession:
+    """
+    Profiles the next `max_requests` requests to `route` (or "*" for any) within `seconds`.
+    Each profiled request runs under cProfile and a stack sampler; the results are written as
+    a .pstats file and a .collapsed file (one 'frame;frame;frame count' line per stack, for
+    flamegraph.pl / speedscope). Only one request is profiled at a time per worker.
+
+    `capture_lock` is held for the whole profiled request; `state_lock` only guards the
+    active/finished flags, so finishing never waits on a capture (which may be the caller's own).
+    A session finished mid-capture is written when that capture ends.
+    """
+
+    def __init__(self, route="*", max_requests=20, seconds=60, interval=PROFILE_SAMPLE_INTERVAL):
+        self.route = route
+        self.max_requests = max_requests
+        self.deadline = time.monotonic() + seconds
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.stacks = Counter()
+        self.capture_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.active = False
+        self.finished = False
+        self.written = False
+        self.captured = 0
+        self.sampler = None
+        self.sampler_stop = threading.Event()
+        self.started_at = datetime.now()
+
+    def expired(self):
+        return self.captured >= self.max_requests or time.monotonic() >= self.deadline
+
+    def begin(self, path):
+        if self.route not in ("*", path) or self.expired():
+            return False
+        if not self.capture_lock.acquire(blocking=False):
+            return False  # another request is being profiled
+        with self.state_lock:
+            if self.finished:
+                self.capture_lock.release()
+                return False
+            self.active = True
+        self.sampler_stop.clear()
+        self.sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+        self.sampler.start()
+        self.profile.enable()
+        return True
+
+    def end(self):
+        self.profile.disable()
+        self.sampler_stop.set()
+        self.sampler.join()
+        self.captured += 1
+        with self.state_lock:
+            self.active = False
+            write_now = self.finished
+        self.capture_lock.release()
+        if write_now:
+            self.write()
+
+    def finish(self):
+        """Stop accepting captures; write now, or when the capture in progress ends."""
+        with self.state_lock:
+            self.finished = True
+            write_now = not self.active
+        if write_now:
+            self.write()
+
+    def sample(self, thread_id):
+        while not self.sampler_stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.stacks[";".join(frame_stack(frame))] += 1
+
+    def write(self):
+        with self.state_lock:
+            if self.written:
+                return
+            self.written = True
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = secure_filename(self.route.strip("/")) or "all"
+        base = os.path.join(PROFILE_DIR, f"{self.started_at:%Y%m%d-%H%M%S-%f}-{slug}-{os.getpid()}")
+        if self.captured:
+            pstats.Stats(self.profile).dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        profile_results.append(base)
+        print(f"🔬 Profiled {self.captured} request(s) to {self.route}: {base}.pstats / .collapsed")
+
+
+profile_session = None
+profile_signal_pending = False
+profile_results = []  # base paths of finished captures in this worker
+
+
+def arm_profiler(route="*", max_requests=20, seconds=60):
+    global profile_session
+    finish_profiler()
+    profile_session = ProfileSession(route, max_requests, seconds)
+    print(f"🔬 Profiling armed for {route}: next {max_requests} request(s) or {seconds}s")
+    return profile_session
+
+
+def finish_profiler():
+    global profile_session
+    finished = profile_session
+    if finished is None:
+        return
+    profile_session = None
+    finished.finish()
+
+
+@app.before_request
+def start_profiling():
+    global profile_signal_pending
+    if profile_session is None and not profile_signal_pending:
+        return
+    if profile_signal_pending:
+        profile_signal_pending = False
+        arm_profiler(PROFILE_SIGNAL_ROUTE, PROFILE_SIGNAL_REQUESTS, PROFILE_SIGNAL_SECONDS)
+    current = profile_session
+    if current is None:
+        return
+    if current.expired():
+        finish_profiler()
+    elif current.begin(request.path):
+        g.profiling = current
+
+
+@app.teardown_request
+def stop_profiling(exc):
+    profiling = g.pop("profiling", None)
+    if profiling is None:
+        return
+    profiling.end()
+    if profiling.expired() and profiling is profile_session:
+        finish_profiler()
+
+
+def handle_profile_signal(signum, frame):
+    # Only set a flag: the handler may interrupt a profiled request on this same thread,
+    # so the session is armed by the next request instead.
+    global profile_signal_pending
+    profile_signal_pending = True
+
+
+profile_signal_pid = None  # process the SIGUSR2 handler was installed in
+
+
+def install_profile_signal():
+    global profile_signal_pid
+    profile_signal_pid = os.getpid()
+    try:
+        signal.signal(signal.SIGUSR2, handle_profile_signal)
+    except AttributeError:
+        pass  # no SIGUSR2 on this platform
+    except ValueError:
+        print(f"⚠️ SIGUSR2 profiling unavailable in process {profile_signal_pid} "
+              "(not on the main thread), use /api/admin/profile")
+
+
+# gunicorn resets worker signals before loading the app, so normally this lands in each
+# worker. When the app was preloaded in the master (--preload or preload_app = True), the
+# forked workers have SIGUSR2 reset to its default action, which terminates them: they
+# install the handler again on their first request, when their pid differs from ours.
+install_profile_signal()
+
+
+@app.before_request
+def install_profile_signal_in_worker():
+    if profile_signal_pid != os.getpid():
+        install_profile_signal()
+
+
+if SLOW_REQUEST_SECONDS > 0:
+    in_flight_requests = {}  # thread id -> [start, method, path, snapshot taken]
+
+    @app.before_request
+    def track_request_start():
+        in_flight_requests[threading.get_ident()] = [time.monotonic(), request.method, request.path, False]
+
+    @app.teardown_request
+    def track_request_end(exc):
+        entry = in_flight_requests.pop(threading.get_ident(), None)
+        if entry and time.monotonic() - entry[0] >= SLOW_REQUEST_SECONDS:
+            print(f"🐢 Slow request: {entry[1]} {entry[2]} took {time.monotonic() - entry[0]:.2f}s")
+
+    def watch_slow_requests():
+        """Snapshot the stack of any request still running past the threshold, once per request."""
+        while True:
+            time.sleep(SLOW_REQUEST_SECONDS / 4)
+            now = time.monotonic()
+            frames = None
+            for thread_id, entry in list(in_flight_requests.items()):
+                if entry[3] or now - entry[0] < SLOW_REQUEST_SECONDS:
+                    continue
+                frames = frames or sys._current_frames()
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                entry[3] = True
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                slug = secure_filename(entry[2].strip("/")) or "index"
+                path = os.path.join(PROFILE_DIR, f"slow-{datetime.now():%Y%m%d-%H%M%S-%f}-{slug}-{os.getpid()}.txt")
+                with open(path, "w") as f:
+                    f.write(f"{entry[1]} {entry[2]} running for {now - entry[0]:.2f}s\n\n")
+                    f.write("".join(traceback.format_stack(frame)))
+                print(f"🐢 {entry[1]} {entry[2]} still running after {now - entry[0]:.1f}s, stack saved to {path}")
+
+    threading.Thread(target=watch_slow_requests, name="slow-request-watchdog", daemon=True).start()
+
+
 # -------------------------- Language Setup --------------------------
 lang_map = {"english": "en", "urdu": "ur", "sindhi": "sd"}
 conversation_history = {}
 MAX_TURNS = 6  # Real-time multi-turn conversation
 
 # -------------------------- Translation Functions --------------------------
+# Both fall back to the untranslated text if the translator is slow or down.
+class TimeoutRequests:
+    """Stands in for deep_translator's `requests` module, which it calls without a timeout."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def get(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return requests.get(*args, **kwargs)
+
+
+# A hung socket would otherwise hold a timeout_executor thread forever
+deep_translator.google.requests = TimeoutRequests(translator_breaker.timeout)
+
+
+def translate(text, source, target):
+    translator = GoogleTranslator(source=source, target=target)
+    return translator_breaker.call(lambda t: run_with_timeout(lambda: translator.translate(text), t))
+
 def translate_to_english(text, lang_code):
     if lang_code == "en":
         return text
-    return GoogleTranslator(source=lang_code, target="en").translate(text)
+    try:
+        return translate(text, lang_code, "en")
+    except Exception as e:
+        print(f"⚠️ Translation to English failed, using original text: {e}")
+        return text
 
 def translate_from_english(text, lang_code):
     if lang_code == "en":
         return text
     # Split into safe chunks
     chunks = [text[i:i+4000] for i in range(0, len(text), 4000)]
-    translated_chunks = [GoogleTranslator(source="en", target=lang_code).translate(c) for c in chunks]
+    try:
+        translated_chunks = [translate(c, "en", lang_code) for c in chunks]
+    except Exception as e:
+        print(f"⚠️ Translation from English failed, using English text: {e}")
+        return text
     return " ".join(translated_chunks)
 
-# -------------------------- Format Conversation --------------------------
-def format_conversation(history, prompt, limit=MAX_TURNS):
-    history_text = ""
-    for turn in history[-limit:]:
-        history_text += f"User: {turn['user']}\nBot: {turn['bot']}\n"
-    history_text += f"User: {prompt}\nBot:"
-    
-    # Real-time practical advice prompt
-    return (
-        "You are AgriBot, an AI agriculture assistant. "
-        "Give practical, actionable advice for crops, fertilizers, pest control, "
-        "and irrigation. Provide approximate ranges and step-by-step instructions, "
-        "do NOT just say 'consult an expert'.\n\n"
-        f"{history_text}"
-    )
+# -------------------------- Conversation Context --------------------------
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", 1500))      # max prompt size sent to Gemini
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", 300))   # room for the summary of older turns
+CHAT_ANSWER_TOKENS = int(os.getenv("CHAT_ANSWER_TOKENS", 250))     # longer bot answers are truncated
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+MAX_SUMMARY_LINES = 50  # compacted turns kept per session before the oldest are dropped
+SUMMARY_HEADER = "Earlier in this conversation:\n"
+
+# Real-time practical advice prompt
+SYSTEM_PROMPT = (
+    "You are AgriBot, an AI agriculture assistant. "
+    "Give practical, actionable advice for crops, fertilizers, pest control, "
+    "and irrigation. Provide approximate ranges and step-by-step instructions, "
+    "do NOT just say 'consult an expert'.\n\n"
+)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_tokens(text, max_tokens):
+    limit = max(max_tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def compact_turn(turn):
+    """One-line summary of an older turn: the question and the first sentence of the answer."""
+    question = truncate_tokens(" ".join(turn["user_en"].split()), 30)
+    answer = " ".join(turn["bot_en"].split()).split(". ")[0]
+    return f"- User asked: {question} | AgriBot: {truncate_tokens(answer, 40)}"
+
+
+def fit_summary(lines, max_tokens=CHAT_SUMMARY_TOKENS):
+    """Join summary lines, dropping the oldest until they fit in `max_tokens`."""
+    lines = list(lines)
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_tokens("\n".join(lines), max_tokens)
+
+
+def turn_summary(turn):
+    # compact form is computed once per turn and reused by every later prompt
+    if "compact" not in turn:
+        turn["compact"] = compact_turn(turn)
+    return turn["compact"]
+
+
+class ConversationContext:
+    """
+    Per-session chat history. The last MAX_TURNS turns are kept verbatim when they fit the
+    budget; older turns are compacted into a rolling summary that is updated once, when they
+    fall out. Recent turns that don't fit verbatim are compacted into the summary too.
+    """
+
+    def __init__(self):
+        self.turns = []
+        self.summary_lines = []
+        self.summary = ""
+
+    def add_turn(self, turn):
+        self.turns.append(turn)
+        while len(self.turns) > MAX_TURNS:
+            self.summary_lines.append(turn_summary(self.turns.pop(0)))
+            self.summary_lines = self.summary_lines[-MAX_SUMMARY_LINES:]
+            self.summary = fit_summary(self.summary_lines)
+
+    def build_prompt(self, user_input, budget=CHAT_TOKEN_BUDGET):
+        """
+        Build the Gemini prompt within `budget` tokens: system prompt, summary of older
+        turns, as many recent turns as fit (newest first), then the new question.
+        """
+        remaining = budget - estimate_tokens(SYSTEM_PROMPT)
+        current = f"User: {truncate_tokens(user_input, remaining // 2)}\nBot:"
+        remaining -= estimate_tokens(current)
+
+        # Room for the summary is reserved up front; recent turns get the rest
+        verbatim_budget = remaining - CHAT_SUMMARY_TOKENS - estimate_tokens(SUMMARY_HEADER + "\n\n")
+        recent = []
+        for turn in reversed(self.turns):
+            block = (
+                f"User: {truncate_tokens(turn['user_en'], CHAT_ANSWER_TOKENS)}\n"
+                f"Bot: {truncate_tokens(turn['bot_en'], CHAT_ANSWER_TOKENS)}\n"
+            )
+            cost = estimate_tokens(block)
+            if cost > verbatim_budget:
+                break
+            recent.insert(0, block)
+            verbatim_budget -= cost
+
+        overflow = self.turns[:len(self.turns) - len(recent)]
+        summary_text = self.summary
+        if overflow:
+            summary_text = fit_summary(self.summary_lines + [turn_summary(t) for t in overflow])
+
+        summary = f"{SUMMARY_HEADER}{summary_text}\n\n" if summary_text else ""
+        if estimate_tokens(summary) > remaining - sum(estimate_tokens(b) for b in recent):
+            summary = ""  # system prompt + question alone nearly fill the budget
+        return SYSTEM_PROMPT + summary + "".join(recent) + current
+
+
+CHAT_UNAVAILABLE = "AgriBot is temporarily unavailable. Please try again in a minute."
+
+chat_metrics_lock = threading.Lock()
+chat_metrics = {"requests": 0, "total_prompt_tokens": 0, "max_prompt_tokens": 0, "last_prompt_tokens": 0}
+
+
+def record_prompt_size(prompt):
+    tokens = estimate_tokens(prompt)
+    with chat_metrics_lock:
+        chat_metrics["requests"] += 1
+        chat_metrics["total_prompt_tokens"] += tokens
+        chat_metrics["max_prompt_tokens"] = max(chat_metrics["max_prompt_tokens"], tokens)
+        chat_metrics["last_prompt_tokens"] = tokens
+    print(f"🧾 Chat prompt: ~{tokens} tokens ({len(prompt)} chars)")
+    return tokens
 
 # ---------------- USER CLASS ----------------
 class User(UserMixin):
@@ -439,6 +1238,87 @@ def api_admin_users():
     return jsonify(users)
 
 
+@app.route("/api/admin/weather_status")
+@jwt_required()
+def api_admin_weather_status():
+    claims = get_jwt()
+
+    if claims["role"] != "admin":
+        return jsonify({"error": "Admin only"}), 403
+
+    return jsonify(weather_refresher.stats())
+
+
+@app.route("/api/admin/service_status")
+@jwt_required()
+def api_admin_service_status():
+    claims = get_jwt()
+
+    if claims["role"] != "admin":
+        return jsonify({"error": "Admin only"}), 403
+
+    return jsonify({
+        "breakers": {b.name: b.stats() for b in breakers},
+        "deferred_writes": {
+            "pending": len(deferred_writes),
+            "max": DEFERRED_WRITES_MAX,
+            **deferred_stats,
+        },
+    })
+
+
+@app.route("/api/admin/profile", methods=["GET", "POST"])
+@jwt_required()
+def api_admin_profile():
+    """
+    POST {"route": "/chat", "requests": 20, "seconds": 60} arms profiling in the worker that
+    handles the call (use `kill -USR2 <pid>` to reach a specific worker once it has served
+    a request); GET shows status.
+    """
+    claims = get_jwt()
+
+    if claims["role"] != "admin":
+        return jsonify({"error": "Admin only"}), 403
+
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            max_requests = int(data.get("requests", 20))
+            seconds = float(data.get("seconds", 60))
+        except (TypeError, ValueError):
+            return jsonify({"error": "requests and seconds must be numbers"}), 400
+        arm_profiler(data.get("route", "*"), max_requests, seconds)
+    elif profile_session is not None and profile_session.expired():
+        finish_profiler()
+
+    active = profile_session
+    return jsonify({
+        "pid": os.getpid(),
+        "active": None if active is None else {
+            "route": active.route,
+            "captured": active.captured,
+            "max_requests": active.max_requests,
+            "seconds_left": max(0, round(active.deadline - time.monotonic(), 1)),
+        },
+        "results": profile_results[-20:],
+    })
+
+
+@app.route("/api/admin/chat_metrics")
+@jwt_required()
+def api_admin_chat_metrics():
+    claims = get_jwt()
+
+    if claims["role"] != "admin":
+        return jsonify({"error": "Admin only"}), 403
+
+    with chat_metrics_lock:
+        metrics = dict(chat_metrics)
+    metrics["avg_prompt_tokens"] = metrics["total_prompt_tokens"] / metrics["requests"] if metrics["requests"] else 0
+    metrics["token_budget"] = CHAT_TOKEN_BUDGET
+    return jsonify(metrics)
+
+
 @app.route("/api/refresh", methods=["POST"])
 @jwt_required(refresh=True)
 def refresh():
@@ -544,6 +1424,300 @@ def admin_dashboard():
         disease_chart_labels=disease_chart_labels,
         disease_chart_values=disease_chart_values
     )
+
+
+# --------- TRENDS ---------
+TRENDS_DB = os.getenv("TRENDS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "trends.sqlite3"))
+TRENDS_WINDOW_DAYS = int(os.getenv("TRENDS_WINDOW_DAYS", 120))  # older day buckets are dropped
+
+
+class TrendCounters:
+    """
+    Daily counters per (kind, region, label), bumped as each detection or recommendation
+    is written. Rows only exist for the rolling window, so reads cost the same however
+    large the history tables grow. Kept in SQLite so every worker sees the same counts.
+    Also remembers each user's last city, used as the region of their next detection.
+    """
+
+    def __init__(self, path, window_days=TRENDS_WINDOW_DAYS):
+        self.path = path
+        self.window_days = window_days
+        self.pruned_on = None
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS trend_counts ("
+                "kind TEXT, day TEXT, region TEXT, label TEXT, n INTEGER, "
+                "PRIMARY KEY (kind, day, region, label))"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS user_regions (user_id TEXT PRIMARY KEY, region TEXT, updated TEXT)")
+        finally:
+            db.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def record(self, kind, label, region=None, when=None):
+        day = (when or datetime.now()).date()
+        region = (region or "Unknown").strip().title() or "Unknown"
+        db = self.connect()
+        try:
+            db.execute(
+                "INSERT INTO trend_counts (kind, day, region, label, n) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (kind, day, region, label) DO UPDATE SET n = n + 1",
+                (kind, day.isoformat(), region, label)
+            )
+            today = datetime.now().date()
+            if self.pruned_on != today:
+                cutoff = today - timedelta(days=self.window_days)
+                db.execute("DELETE FROM trend_counts WHERE day < ?", (cutoff.isoformat(),))
+                self.pruned_on = today
+        finally:
+            db.close()
+
+    def set_user_region(self, user_id, region):
+        db = self.connect()
+        try:
+            db.execute(
+                "INSERT INTO user_regions (user_id, region, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET region = excluded.region, updated = excluded.updated",
+                (str(user_id), region.strip(), datetime.now().isoformat())
+            )
+        finally:
+            db.close()
+
+    def user_region(self, user_id):
+        db = self.connect()
+        try:
+            row = db.execute("SELECT region FROM user_regions WHERE user_id = ?", (str(user_id),)).fetchone()
+        finally:
+            db.close()
+        return row[0] if row else None
+
+    def summary(self, kind, days=30, region=None):
+        """Daily, weekly, per-region and total counts for the last `days` days (1..window)."""
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        today = datetime.now().date()
+        since = today - timedelta(days=min(days, self.window_days) - 1)
+        sql = "SELECT day, region, label, n FROM trend_counts WHERE kind = ? AND day >= ?"
+        params = [kind, since.isoformat()]
+        if region:
+            sql += " AND region = ?"
+            params.append(region.strip().title())
+        db = self.connect()
+        try:
+            rows = db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+        daily, weekly, by_region, totals = {}, {}, {}, Counter()
+        recent, previous = Counter(), Counter()  # last 7 days vs the 7 before, per (region, label)
+        for day, row_region, label, n in rows:
+            date = datetime.strptime(day, "%Y-%m-%d").date()
+            week = f"{date.isocalendar()[0]}-W{date.isocalendar()[1]:02d}"
+            daily.setdefault(day, Counter())[label] += n
+            weekly.setdefault(week, Counter())[label] += n
+            by_region.setdefault(row_region, Counter())[label] += n
+            totals[label] += n
+            age = (today - date).days
+            if age < 7:
+                recent[(row_region, label)] += n
+            elif age < 14:
+                previous[(row_region, label)] += n
+
+        rising = [
+            {"region": r, "label": label, "last_7_days": n, "previous_7_days": previous[(r, label)]}
+            for (r, label), n in recent.most_common()
+            if n >= 3 and n >= 2 * previous[(r, label)]
+        ]
+        return {
+            "daily": {k: dict(v) for k, v in sorted(daily.items())},
+            "weekly": {k: dict(v) for k, v in sorted(weekly.items())},
+            "by_region": {k: dict(v) for k, v in sorted(by_region.items())},
+            "totals": dict(totals.most_common()),
+            "rising": rising,
+        }
+
+
+trend_counters = TrendCounters(TRENDS_DB)
+
+
+def record_trend(kind, label, region=None):
+    if not label:
+        return
+    try:
+        trend_counters.record(kind, label, region)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not update {kind} trends: {e}")
+
+
+def remember_user_region(user_id, region):
+    if not region or not region.strip():
+        return
+    try:
+        trend_counters.set_user_region(user_id, region)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not save region for user {user_id}: {e}")
+
+
+def last_user_region(user_id):
+    try:
+        return trend_counters.user_region(user_id)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not read region for user {user_id}: {e}")
+        return None
+
+
+@app.route("/api/admin/trends")
+@jwt_required()
+def api_admin_trends():
+    claims = get_jwt()
+
+    if claims["role"] != "admin":
+        return jsonify({"error": "Admin only"}), 403
+
+    try:
+        days = int(request.args.get("days", 30))
+    except ValueError:
+        days = None
+    if days is None or not 1 <= days <= TRENDS_WINDOW_DAYS:
+        return jsonify({"error": f"days must be an integer between 1 and {TRENDS_WINDOW_DAYS}"}), 400
+    region = request.args.get("region")
+    return jsonify({
+        "days": days,
+        "diseases": trend_counters.summary("disease", days, region),
+        "crops": trend_counters.summary("crop", days, region),
+    })
+
+
+# --------- EXPORTS ---------
+# Columns each export falls back to for its header row when no rows match
+EXPORT_TABLES = {
+    "crop_recommendations": ["id", "user_id", "soil_data", "weather_data", "recommended_crop", "created_at"],
+    "disease_detections": ["id", "user_id", "disease_name", "disease_description", "possible_steps",
+                           "disease_image_url", "supplement_name", "supplement_image_url",
+                           "supplement_buy_url", "created_at"],
+    "chat_logs": ["id", "user_id", "question", "answer", "language", "created_at"],
+}
+# Leading characters that make Excel/Sheets treat a cell as a formula
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 1000))
+
+
+def iter_table_rows(table, user_id=None, start=None, end=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield rows of a history table ordered by (created_at, id), one page at a time.
+    Uses keyset pagination so each page is an index range scan, not an OFFSET.
+    """
+    last = None
+    while True:
+        query = supabase.table(table).select("*")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if start:
+            query = query.gte("created_at", start)
+        if end:
+            query = query.lt("created_at", end)
+        if last:
+            ts, row_id = last
+            # postgrest 0.13 (pinned via supabase 2.3.1) has no or_(), so add the filter param directly
+            query.params = query.params.add(
+                "or", f'(created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt."{row_id}"))'
+            )
+        # One order param: postgrest 0.13 sends chained .order() calls as repeated params
+        rows = query.order("created_at,id").limit(page_size).execute().data or []
+
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last = (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def export_cell(value):
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    # User-typed text (chat questions, answers) must not turn into a live formula in a spreadsheet
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        value = "'" + value
+    return value
+
+
+def stream_csv(rows, columns):
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow({k: export_cell(v) for k, v in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if writer is None:
+        # Nothing matched: still send the header so the download isn't a 0-byte file
+        csv.writer(buffer).writerow(columns)
+        yield buffer.getvalue()
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + "\n"
+
+
+def export_response(table, fmt, user_id=None):
+    """Stream a history table as CSV or NDJSON, filtered by ?start=&end= (YYYY-MM-DD) and user."""
+    if table not in EXPORT_TABLES or fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "Unknown export"}), 404
+
+    try:
+        start = request.args.get("start")
+        end = request.args.get("end")
+        start = datetime.strptime(start, "%Y-%m-%d").date().isoformat() if start else None
+        # end date is inclusive
+        end = (datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)).date().isoformat() if end else None
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+
+    rows = iter_table_rows(table, user_id=user_id, start=start, end=end)
+    body = stream_csv(rows, EXPORT_TABLES[table]) if fmt == "csv" else stream_ndjson(rows)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = f"{table}_{datetime.now():%Y%m%d}.{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@app.route('/admin/export/<table>.<fmt>')
+@login_required
+def admin_export(table, fmt):
+    if current_user.role != "admin":
+        flash("Access denied!", "danger")
+        return redirect(url_for('dashboard'))
+    return export_response(table, fmt, user_id=request.args.get("user_id"))
+
+
+@app.route("/api/admin/export/<table>.<fmt>")
+@jwt_required()
+def api_admin_export(table, fmt):
+    claims = get_jwt()
+
+    if claims["role"] != "admin":
+        return jsonify({"error": "Admin only"}), 403
+
+    return export_response(table, fmt, user_id=request.args.get("user_id"))
+
+
+@app.route("/api/export/<table>.<fmt>")
+@jwt_required()
+def api_export(table, fmt):
+    return export_response(table, fmt, user_id=get_jwt_identity())
+
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -567,81 +1741,491 @@ import os, json, requests
 from datetime import datetime, timedelta
 
 CACHE_FILE = "weather_cache.json"
+WEATHER_TTL = 86400  # cached weather is valid for 24 hours
+weather_cache_lock = threading.Lock()
+
+
+def read_weather_cache_file():
+    """Cache file contents, or {} if it is missing or corrupt."""
+    try:
+        with open(CACHE_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable weather cache {CACHE_FILE}: {e}")
+        return {}
+
 
 # Load existing cache
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r") as f:
-        weather_cache = json.load(f)
-else:
-    weather_cache = {}
+weather_cache = read_weather_cache_file()
 
-def get_weather_data(city, api_key):
-    """
-    Fetch 3-month average weather (temp, humidity, rainfall) for a city using Visual Crossing API.
-    Uses cache to save API calls (valid for 24 hours).
-    """
-    now = datetime.now()
 
-    # ✅ Check if city data is in cache and still valid (less than 1 day old)
-    if city in weather_cache:
-        cached = weather_cache[city]
-        if (now - datetime.fromisoformat(cached["timestamp"])).total_seconds() < 86400:
-            print(f"🌤️ Using cached weather data for {city}")
-            return cached["avg_temp"], cached["avg_humidity"], cached["total_rainfall"]
+@contextmanager
+def weather_cache_file_lock():
+    """flock() shared by every thread and worker that writes the cache file."""
+    fd = os.open(f"{CACHE_FILE}.lock", os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def merge_weather_cache(entries):
+    """Merge cache entries into memory, keeping the newer timestamp per city."""
+    with weather_cache_lock:
+        for city, entry in entries.items():
+            current = weather_cache.get(city)
+            if current is None or entry["timestamp"] > current["timestamp"]:
+                weather_cache[city] = entry
+
+
+def reload_weather_cache():
+    """Pick up entries other workers (or the refresh leader) have written."""
+    merge_weather_cache(read_weather_cache_file())
+
+
+def save_weather_cache():
+    # Merge with what other workers wrote, then replace the file atomically
+    with weather_cache_file_lock():
+        merge_weather_cache(read_weather_cache_file())
+        with weather_cache_lock:
+            snapshot = dict(weather_cache)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(CACHE_FILE)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(snapshot, f, indent=4)
+            os.replace(tmp_path, CACHE_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def weather_cache_age(city, now=None):
+    """Seconds since the cached entry for `city` was stored, or None if not cached."""
+    cached = weather_cache.get(city)
+    if not cached:
+        return None
+    now = now or datetime.now()
+    return (now - datetime.fromisoformat(cached["timestamp"])).total_seconds()
+
+
+# --------- DAILY WEATHER STORE ---------
+WEATHER_WINDOW_DAYS = int(os.getenv("WEATHER_WINDOW_DAYS", 90))  # rolling window for averages
+WEATHER_STORE_DIR = os.getenv("WEATHER_STORE_DIR", "weather_store")
+WEATHER_URL = (
+    "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
+    "{city}/{start}/{end}?unitGroup=metric&include=days&key={key}&contentType=json"
+)
+WEATHER_FIELDS = ("temp", "humidity", "precip")
+os.makedirs(WEATHER_STORE_DIR, exist_ok=True)
+
+
+def normalize_city(city):
+    """'  Hyderabad ,PK' and 'hyderabad, pk' -> 'hyderabad,pk'; non-Latin names are kept as they are."""
+    city = unicodedata.normalize("NFKC", city).casefold()
+    return ",".join(" ".join(part.split()) for part in city.split(","))
+
+
+def weather_store_path(city):
+    # Hashed so every city (any script, any spelling of separators) gets its own file
+    digest = hashlib.sha256(normalize_city(city).encode("utf-8")).hexdigest()[:20]
+    return os.path.join(WEATHER_STORE_DIR, f"{digest}.npz")
+
+
+def load_weather_store(city):
+    """Daily observations for a city as sorted NumPy arrays: day (datetime64[D]), temp, humidity, precip."""
+    path = weather_store_path(city)
+    if os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                return {k: data[k] for k in ("day",) + WEATHER_FIELDS}
+        except Exception as e:
+            print(f"⚠️ Corrupt weather store for {city}, rebuilding: {e}")
+    store = {k: np.array([], dtype=np.float64) for k in WEATHER_FIELDS}
+    store["day"] = np.array([], dtype="datetime64[D]")
+    return store
+
+
+def save_weather_store(city, store):
+    fd, tmp_path = tempfile.mkstemp(dir=WEATHER_STORE_DIR, suffix=".tmp.npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **store)
+        os.replace(tmp_path, weather_store_path(city))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def merge_weather_days(store, days):
+    """Merge Visual Crossing `days` records into the store; newly fetched values win on duplicate dates."""
+    new = {"day": np.array([d["datetime"] for d in days], dtype="datetime64[D]")}
+    for field in WEATHER_FIELDS:
+        new[field] = np.array([d.get(field) or 0 for d in days], dtype=np.float64)
+
+    combined = {k: np.concatenate([new[k], store[k]]) for k in store}
+    _, first = np.unique(combined["day"], return_index=True)  # sorted, first occurrence = new data
+    return {k: v[first] for k, v in combined.items()}
 
-    # --- Otherwise, fetch fresh data ---
-    start_date = now - timedelta(days=90)  # 3 months
-    start_date_str = start_date.strftime("%Y-%m-%d")
-    end_date_str = now.strftime("%Y-%m-%d")
-
-    url = (
-        f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/"
-        f"{city}/{start_date_str}/{end_date_str}"
-        f"?unitGroup=metric&include=days&key={api_key}&contentType=json"
-    )
 
-    print(f"🌦️ Fetching 3-month weather data for {city}...")
-    response = requests.get(url)
+def fetch_weather_days(city, api_key, start, end):
+    """Download daily records for [start, end] from Visual Crossing. Returns the list of days, or None on failure."""
+    url = WEATHER_URL.format(city=city, start=start, end=end, key=api_key)
+
+    def get(timeout):
+        resp = requests.get(url, timeout=timeout)
+        if resp.status_code >= 500:
+            raise requests.HTTPError(f"Visual Crossing returned {resp.status_code}")
+        return resp
+
+    print(f"🌦️ Fetching weather data for {city} ({start} → {end})...")
+    try:
+        response = weather_breaker.call(get)
+    except Exception as e:
+        print(f"⚠️ Weather API unavailable for {city}: {e}")
+        return None
     print("Status Code:", response.status_code)
 
     if response.status_code != 200:
         print(f"⚠️ Weather API Error for {city}: {response.text[:200]}")
-        return 0, 0, 0
+        return None
 
     try:
-        data = response.json()
-        days = data.get("days", [])
-        if not days:
-            print(f"⚠️ No 'days' field found for {city}")
-            return 0, 0, 0
-
-        total_temp, total_humidity, total_rainfall = 0, 0, 0
-        for day in days:
-            total_temp += day.get("temp", 0)
-            total_humidity += day.get("humidity", 0)
-            total_rainfall += day.get("precip", 0)
-
-        count = len(days)
-        avg_temp = total_temp / count if count else 0
-        avg_humidity = total_humidity / count if count else 0
-        total_rainfall = total_rainfall if count else 0
-
-        # ✅ Save to cache for reuse
+        days = response.json().get("days", [])
+    except ValueError as e:
+        print("❌ Error parsing weather data:", e)
+        return None
+    if not days:
+        print(f"⚠️ No 'days' field found for {city}")
+        return None
+    return days
+
+
+def fetch_weather_data(city, api_key, window_days=None):
+    """
+    Bring the city's daily store up to date and store the rolling-window averages in the cache.
+    Only days missing from the store are downloaded; the latest stored day is always
+    re-fetched because today's record is still partial.
+    Returns (avg_temp, avg_humidity, total_rainfall), or None if the fetch failed.
+    """
+    window_days = window_days or WEATHER_WINDOW_DAYS
+    now = datetime.now()
+    today = np.datetime64(now.date(), "D")
+    window_start = today - np.timedelta64(window_days, "D")
+
+    store = load_weather_store(city)
+    if len(store["day"]) and store["day"][0] <= window_start:
+        fetch_start = max(store["day"][-1], window_start)
+    else:
+        fetch_start = window_start  # empty store, or the window grew past what we hold
+
+    days = fetch_weather_days(city, api_key, str(fetch_start), str(today))
+    if days is None:
+        return None
+
+    try:
+        store = merge_weather_days(store, days)
+    except (KeyError, ValueError) as e:
+        print("❌ Error parsing weather data:", e)
+        return None
+
+    keep = store["day"] >= window_start
+    store = {k: v[keep] for k, v in store.items()}
+    save_weather_store(city, store)
+
+    count = len(store["day"])
+    if not count:
+        return None
+    avg_temp = float(store["temp"].mean())
+    avg_humidity = float(store["humidity"].mean())
+    total_rainfall = float(store["precip"].sum())
+
+    # ✅ Save to cache for reuse
+    with weather_cache_lock:
         weather_cache[city] = {
             "avg_temp": avg_temp,
             "avg_humidity": avg_humidity,
             "total_rainfall": total_rainfall,
             "timestamp": now.isoformat()
         }
-        with open(CACHE_FILE, "w") as f:
-            json.dump(weather_cache, f, indent=4)
+    save_weather_cache()
 
-        print(f"✅ Fetched {count} days for {city}: Temp={avg_temp:.2f}, Humidity={avg_humidity:.2f}, Rain={total_rainfall:.2f}")
-        return avg_temp, avg_humidity, total_rainfall
+    print(f"✅ {count} days for {city} ({len(days)} fetched): Temp={avg_temp:.2f}, Humidity={avg_humidity:.2f}, Rain={total_rainfall:.2f}")
+    return avg_temp, avg_humidity, total_rainfall
 
-    except Exception as e:
-        print("❌ Error parsing weather data:", e)
-        return 0, 0, 0
+
+def get_weather_data(city, api_key):
+    """
+    Fetch rolling-window (default 3-month) average weather (temp, humidity, rainfall) for a city using Visual Crossing API.
+    Uses cache to save API calls (valid for 24 hours); hot cities are kept fresh by weather_refresher
+    and misses only download the days not already in the city's daily store.
+    """
+    weather_refresher.record_request(city)
+
+    # ✅ Check if city data is in cache and still valid (less than 1 day old)
+    age = weather_cache_age(city)
+    if age is None or age >= WEATHER_TTL:
+        reload_weather_cache()  # another worker may have refreshed it already
+        age = weather_cache_age(city)
+    if age is not None and age < WEATHER_TTL:
+        print(f"🌤️ Using cached weather data for {city}")
+        cached = weather_cache[city]
+        return cached["avg_temp"], cached["avg_humidity"], cached["total_rainfall"]
+
+    # --- Otherwise, fetch fresh data ---
+    result = fetch_weather_data(city, api_key)
+    if result is not None:
+        return result
+
+    # Upstream failed: stale data beats no data
+    if age is not None:
+        print(f"⚠️ Using stale weather data for {city} ({age / 3600:.0f}h old)")
+        cached = weather_cache[city]
+        return cached["avg_temp"], cached["avg_humidity"], cached["total_rainfall"]
+    return 0, 0, 0
+
+
+# --------- WEATHER REFRESH-AHEAD ---------
+WEATHER_REFRESH_ENABLED = os.getenv("WEATHER_REFRESH_ENABLED", "1") == "1"
+WEATHER_REFRESH_AHEAD = int(os.getenv("WEATHER_REFRESH_AHEAD", 3 * 3600))     # refresh this long before expiry
+WEATHER_REFRESH_JITTER = int(os.getenv("WEATHER_REFRESH_JITTER", 1800))       # spread refreshes over this many seconds
+WEATHER_REFRESH_INTERVAL = int(os.getenv("WEATHER_REFRESH_INTERVAL", 300))    # how often the scheduler wakes up
+WEATHER_REFRESH_WORKERS = int(os.getenv("WEATHER_REFRESH_WORKERS", 2))        # max concurrent upstream fetches
+WEATHER_HOT_CITIES = int(os.getenv("WEATHER_HOT_CITIES", 20))                 # how many cities to keep warm
+WEATHER_HOT_DAYS = int(os.getenv("WEATHER_HOT_DAYS", 7))                      # rank cities by this many days of requests
+WEATHER_PREWARM_DISTRICTS = [
+    c.strip() for c in os.getenv("WEATHER_PREWARM_DISTRICTS", "").split(",") if c.strip()
+]
+
+
+class WeatherRefreshScheduler:
+    """
+    Keeps hot cities' weather cache fresh in the background so crop requests
+    don't pay for the Visual Crossing fetch themselves.
+
+    A city is hot if it is in the prewarm list, among the most requested cities,
+    or already in the cache (filling up to `hot_limit`). Each city is refreshed
+    once its cache age passes TTL - refresh_ahead - jitter, with a fresh random
+    jitter per cycle so cities cached together don't all refresh together.
+
+    Every worker starts a scheduler, but only the one holding the flock() on
+    `leader_path` refreshes; the others take over if it exits. Request counts are
+    kept per day in SQLite (`counts_path`), so the leader ranks cities by every
+    worker's traffic, even when it is a preloading master that serves none itself.
+    """
+
+    def __init__(self, fetch, prewarm=(), refresh_ahead=WEATHER_REFRESH_AHEAD,
+                 jitter=WEATHER_REFRESH_JITTER, interval=WEATHER_REFRESH_INTERVAL,
+                 workers=WEATHER_REFRESH_WORKERS, hot_limit=WEATHER_HOT_CITIES,
+                 hot_days=WEATHER_HOT_DAYS, leader_path=f"{CACHE_FILE}.refresh.lock",
+                 counts_path=TRENDS_DB):
+        self.fetch = fetch
+        self.leader_path = leader_path
+        self.leader_fd = None
+        self.counts_path = counts_path
+        self.hot_days = hot_days
+        self.pruned_on = None
+        self.prewarm = list(prewarm)
+        self.refresh_ahead = refresh_ahead
+        self.jitter = jitter
+        self.interval = interval
+        self.workers = workers
+        self.hot_limit = hot_limit
+
+        self.lock = threading.Lock()
+        self.jitter_offsets = {}
+        self.in_flight = set()
+        self.last_refresh = {}
+        self.failures = Counter()
+        self.consecutive_failures = Counter()
+        self.retry_at = {}
+        self.last_error = {}
+
+        self.executor = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+        db = self.connect()
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS weather_requests (city TEXT, day TEXT, n INTEGER, PRIMARY KEY (city, day))"
+            )
+        finally:
+            db.close()
+
+    def connect(self):
+        return sqlite3.connect(self.counts_path, timeout=5, isolation_level=None)
+
+    def record_request(self, city):
+        if not city:
+            return
+        today = datetime.now().date()
+        try:
+            db = self.connect()
+            try:
+                db.execute(
+                    "INSERT INTO weather_requests (city, day, n) VALUES (?, ?, 1) "
+                    "ON CONFLICT (city, day) DO UPDATE SET n = n + 1",
+                    (city, today.isoformat())
+                )
+                if self.pruned_on != today:
+                    cutoff = today - timedelta(days=self.hot_days)
+                    db.execute("DELETE FROM weather_requests WHERE day < ?", (cutoff.isoformat(),))
+                    self.pruned_on = today
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not count weather request for {city}: {e}")
+
+    def request_counts(self, limit=-1):
+        """Requests per city over the last `hot_days` days, from every worker, most requested first."""
+        since = datetime.now().date() - timedelta(days=self.hot_days - 1)
+        db = self.connect()
+        try:
+            rows = db.execute(
+                "SELECT city, SUM(n) AS total FROM weather_requests WHERE day >= ? "
+                "GROUP BY city ORDER BY total DESC LIMIT ?",
+                (since.isoformat(), limit)
+            ).fetchall()
+        finally:
+            db.close()
+        return dict(rows)
+
+    def hot_cities(self):
+        ranked = list(self.request_counts(self.hot_limit))
+        cities = list(dict.fromkeys(self.prewarm + ranked))
+        for city in list(weather_cache):
+            if len(cities) >= self.hot_limit + len(self.prewarm):
+                break
+            if city not in cities:
+                cities.append(city)
+        return cities
+
+    def is_due(self, city, now=None):
+        now = now or datetime.now()
+        with self.lock:
+            retry_at = self.retry_at.get(city)
+        if retry_at and now < retry_at:
+            return False  # backing off after a failed refresh
+        age = weather_cache_age(city, now)
+        if age is None:
+            return True
+        with self.lock:
+            offset = self.jitter_offsets.setdefault(city, random.uniform(0, self.jitter))
+        return age >= WEATHER_TTL - self.refresh_ahead - offset
+
+    def record_failure(self, city, error):
+        with self.lock:
+            self.failures[city] += 1
+            self.consecutive_failures[city] += 1
+            backoff = min(self.interval * 2 ** (self.consecutive_failures[city] - 1), WEATHER_TTL / 4)
+            self.retry_at[city] = datetime.now() + timedelta(seconds=backoff)
+            self.last_error[city] = error
+
+    def refresh(self, city):
+        try:
+            result = self.fetch(city, os.getenv("VC_API_KEY"))
+            if result is None:
+                self.record_failure(city, "fetch failed")
+            else:
+                with self.lock:
+                    self.last_refresh[city] = datetime.now().isoformat()
+                    self.consecutive_failures.pop(city, None)
+                    self.retry_at.pop(city, None)
+                    self.last_error.pop(city, None)
+        except Exception as e:
+            print(f"❌ Background weather refresh failed for {city}: {e}")
+            self.record_failure(city, str(e))
+        finally:
+            with self.lock:
+                self.in_flight.discard(city)
+                self.jitter_offsets.pop(city, None)  # re-roll jitter for the next cycle
+
+    def tick(self):
+        """Submit refreshes for every hot city that is due. Returns the cities submitted."""
+        now = datetime.now()
+        submitted = []
+        for city in self.hot_cities():
+            if not self.is_due(city, now):
+                continue
+            with self.lock:
+                if city in self.in_flight:
+                    continue
+                self.in_flight.add(city)
+            self.executor.submit(self.refresh, city)
+            submitted.append(city)
+        return submitted
+
+    def try_become_leader(self):
+        if self.leader_fd is not None:
+            return True
+        fd = os.open(self.leader_path, os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.leader_fd = fd  # held until the process exits
+        print(f"🔄 Worker {os.getpid()} is the weather refresh leader")
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                if not self.try_become_leader():
+                    self.stop_event.wait(self.interval)
+                    continue
+                reload_weather_cache()
+                submitted = self.tick()
+                if submitted:
+                    print(f"🔄 Refreshing weather ahead of expiry: {', '.join(submitted)}")
+            except Exception as e:
+                print(f"❌ Weather refresh scheduler error: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="weather-refresh")
+        self.thread = threading.Thread(target=self.run, name="weather-refresh-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    def stats(self):
+        request_counts = self.request_counts()
+        with self.lock:
+            cities = set(request_counts) | set(self.last_refresh) | set(self.failures) | set(self.prewarm)
+            per_city = {
+                city: {
+                    "requests": request_counts.get(city, 0),
+                    "last_refresh": self.last_refresh.get(city),
+                    "failures": self.failures.get(city, 0),
+                    "last_error": self.last_error.get(city),
+                    "cache_age_seconds": weather_cache_age(city),
+                    "refreshing": city in self.in_flight,
+                }
+                for city in sorted(cities)
+            }
+        return {
+            "running": self.thread is not None and self.thread.is_alive(),
+            "leader": self.leader_fd is not None,
+            "pid": os.getpid(),
+            "prewarm": self.prewarm,
+            "cities": per_city,
+        }
+
+
+weather_refresher = WeatherRefreshScheduler(fetch_weather_data, prewarm=WEATHER_PREWARM_DISTRICTS)
+if WEATHER_REFRESH_ENABLED and os.getenv("VC_API_KEY"):
+    weather_refresher.start()
 
 
 
@@ -679,7 +2263,7 @@ def crop_recommendation():
             recommended = crop_mapping.get(pred_class, "Unknown Crop")
 
             # 4️⃣ Save record to database
-            supabase.table("crop_recommendations").insert({
+            db_insert("crop_recommendations", {
                 "user_id": current_user.id,
                 "soil_data": {"ph": soil_ph, "nutrients": nutrients},
                 "weather_data": {
@@ -688,7 +2272,9 @@ def crop_recommendation():
                     "rainfall": total_rainfall
                 },
                 "recommended_crop": recommended
-            }).execute()
+            })
+            remember_user_region(current_user.id, city)
+            record_trend("crop", recommended, city)
 
             # 5️⃣ Build result for frontend
             result = {
@@ -721,6 +2307,7 @@ def crop_recommendation():
 # --------- DISEASE DETECTION ---------
 @app.route('/disease_detection', methods=['GET', 'POST'])
 @login_required
+@rate_limited("disease_detection", DISEASE_RATE_PER_MIN, DISEASE_BURST)
 def disease_detection():
     if request.method == 'POST':
         file = request.files.get('image')
@@ -731,9 +2318,9 @@ def disease_detection():
         filename = secure_filename(file.filename)
         unique_name = f"{uuid.uuid4().hex}_{filename}"
         path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-        file.save(path)
-
-        result = predict_image(path)
+        with inference_slots.acquire():
+            file.save(path)
+            result = predict_image(path)
         
         if not result['success']:
              flash("Prediction failed.", "danger")
@@ -757,7 +2344,11 @@ def disease_detection():
             "supplement_buy_url": s_info.iloc[0]['buy link'] if not s_info.empty else None
 }
 
-        supabase.table("disease_detections").insert(record).execute()
+        db_insert("disease_detections", record)
+        # Region: the form's city field, else the user's last known city
+        region = (request.form.get('city') or "").strip() or last_user_region(current_user.id)
+        remember_user_region(current_user.id, region)
+        record_trend("disease", result['readable_class'], region)
 
         data = {
             "image_path": url_for('uploaded_file', filename=unique_name),
@@ -778,17 +2369,18 @@ def disease_detection():
 
         return render_template("disease_result.html", data=data)
 
-    return render_template('disease_detection.html')
+    return render_template('disease_detection.html', last_city=last_user_region(current_user.id))
 
 # --------- CHATBOT ---------
 @app.route('/chat', methods=['GET', 'POST'])
 @login_required
+@rate_limited("chat", CHAT_RATE_PER_MIN, CHAT_BURST)
 def chat():
     if request.method == 'GET':
         # Initialize or clear conversation for this session
         session_id = session.get('session_id', str(uuid.uuid4()))
         session['session_id'] = session_id
-        conversation_history[session_id] = []
+        conversation_history[session_id] = ConversationContext()
         return render_template("chatbot.html")
     
     if request.method == 'POST':
@@ -799,34 +2391,34 @@ def chat():
         # Get session-specific history
         session_id = session.get('session_id')
         if session_id not in conversation_history:
-            conversation_history[session_id] = []
+            conversation_history[session_id] = ConversationContext()
         
-        history = conversation_history[session_id]
+        context = conversation_history[session_id]
         
         # 🔹 Translate user input to English
         translated_input = translate_to_english(user_input, lang)
         
-        # 🔹 Format conversation for Gemini using ONLY English versions
-        prompt = "You are AgriBot, an AI agriculture assistant. "
-        prompt += "Give practical, actionable advice for crops, fertilizers, pest control, "
-        prompt += "and irrigation. Provide approximate ranges and step-by-step instructions, "
-        prompt += "do NOT just say 'consult an expert'.\n\n"
-        
-        # Add conversation history in English only
-        for turn in history[-6:]:
-            prompt += f"User: {turn['user_en']}\nBot: {turn['bot_en']}\n"
-        
-        prompt += f"User: {translated_input}\nBot:"
+        # 🔹 Build a token-budgeted prompt from English versions only
+        prompt = context.build_prompt(translated_input)
+        record_prompt_size(prompt)
         
         # 🔹 Generate response
-        response_obj = chat_model.generate_content(prompt)
-        response = response_obj.text.strip()
+        with llm_slots.acquire():
+            try:
+                response_obj = gemini_breaker.call(
+                    lambda t: chat_model.generate_content(prompt, request_options={"timeout": t})
+                )
+                response = response_obj.text.strip()
+            except Exception as e:
+                # Breaker open, deadline hit or Gemini error: answer quickly instead of hanging
+                print(f"❌ Gemini unavailable: {e}")
+                return jsonify({"answer": translate_from_english(CHAT_UNAVAILABLE, lang), "degraded": True})
         
         # 🔹 Translate back to original language
         final_response = translate_from_english(response, lang)
         
-        # 🔹 Store in history with both versions
-        history.append({
+        # 🔹 Store in history with both versions (older turns get summarised)
+        context.add_turn({
             "user_original": user_input,
             "user_en": translated_input,
             "bot_original": final_response,
@@ -834,17 +2426,13 @@ def chat():
             "language": lang
         })
         
-        # Keep only last 6 turns
-        if len(history) > 6:
-            history.pop(0)
-        
         # 🔹 Save logs in Supabase
-        supabase.table("chat_logs").insert({
+        db_insert("chat_logs", {
             "user_id": current_user.id,
             "question": user_input,
             "answer": final_response,
             "language": lang
-        }).execute()
+        })
         
         return jsonify({"answer": final_response})
 
@@ -854,7 +2442,7 @@ def chat():
 def clear_history():
     session_id = session.get('session_id')
     if session_id and session_id in conversation_history:
-        conversation_history[session_id] = []
+        conversation_history[session_id] = ConversationContext()
     return jsonify({"status": "success"})
 
 # -------------------------- File Serve --------------------------
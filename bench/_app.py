@@ -0,0 +1,40 @@
+# Shared setup for the bench scripts: import app.py with placeholder credentials and
+# local state in a temp dir, so nothing talks to Supabase/Gemini or touches real data.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIR = tempfile.mkdtemp(prefix="agrismart_bench_")
+
+os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench")  # must look like a JWT
+os.environ.setdefault("GOOGLE_API_KEY", "bench-key")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+os.environ.setdefault("RATE_LIMIT_DIR", os.path.join(STATE_DIR, "limits"))
+os.environ.setdefault("WEATHER_STORE_DIR", os.path.join(STATE_DIR, "weather_store"))
+os.environ.setdefault("TRENDS_DB", os.path.join(STATE_DIR, "trends.sqlite3"))
+os.environ.setdefault("PROFILE_DIR", os.path.join(STATE_DIR, "profiles"))
+os.environ["WEATHER_REFRESH_ENABLED"] = "0"
+
+os.chdir(ROOT)  # app.py loads models and CSVs by relative path
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+
+app.app.config["UPLOAD_FOLDER"] = os.path.join(STATE_DIR, "uploads")
+os.makedirs(app.app.config["UPLOAD_FOLDER"], exist_ok=True)
+app.CACHE_FILE = os.path.join(STATE_DIR, "weather_cache.json")
+app.weather_cache.clear()
+real_db_insert = app.db_insert
+app.db_insert = lambda table, row: None  # don't queue writes to the placeholder Supabase
+app.login_manager.user_loader(lambda uid: app.User(uid, f"Bench {uid}", f"{uid}@example.com"))
+
+
+def logged_in_client(user_id="bench-user"):
+    """Flask test client with a logged-in session, without a Supabase lookup."""
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["_user_id"] = user_id
+        sess["_fresh"] = True
+    return client
@@ -0,0 +1,57 @@
+# Local HTTP stand-in for the upstream services (Supabase REST, Visual Crossing, Google
+# Translate), so benches can inject latency and failures without touching the network.
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubServer:
+    """
+    Routes requests by path prefix to handler(method, path, query, body), which returns
+    (status, payload): dicts and lists are sent as JSON, strings as HTML.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = Counter()
+        self.requests = []  # (method, path, query) for every request served
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_one(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                for prefix, handler in stub.routes.items():
+                    if url.path.startswith(prefix):
+                        stub.hits[prefix] += 1
+                        stub.requests.append((self.command, url.path, parse_qs(url.query)))
+                        status, payload = handler(self.command, url.path, parse_qs(url.query), body)
+                        break
+                else:
+                    status, payload = 404, {"message": f"no stub for {url.path}"}
+                is_json = not isinstance(payload, str)
+                data = (json.dumps(payload) if is_json else payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json" if is_json else "text/html")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up waiting, which is what some benches test
+
+            do_GET = do_POST = handle_one
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def route(self, prefix, handler):
+        self.routes[prefix] = handler
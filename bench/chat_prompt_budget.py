@@ -0,0 +1,55 @@
+# Drive /chat for 50 turns with a fake Gemini model and check the prompt never exceeds
+# CHAT_TOKEN_BUDGET, however long the answers get.
+#
+#   python bench/chat_prompt_budget.py
+import os
+import random
+import sys
+
+os.environ.setdefault("CHAT_BURST", "1000")  # this script is about prompt size, not rate limits
+
+from _app import app, logged_in_client  # noqa: E402
+
+TURNS = 50
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Records prompt sizes and answers with anything from one line to ~12k characters."""
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.prompt_tokens = []
+
+    def generate_content(self, prompt, request_options=None):
+        self.prompt_tokens.append(app.estimate_tokens(prompt))
+        sentences = self.random.choice([1, 5, 40, 200, 600])
+        return FakeResponse("Apply 40 kg urea per acre. " + "Irrigate every 7 days in dry spells. " * sentences)
+
+
+def main():
+    app.chat_model = FakeModel()
+    client = logged_in_client()
+    client.get("/chat")
+
+    for i in range(TURNS):
+        question = f"Turn {i}: how should I manage wheat in week {i}? " * (1 + i % 7)
+        resp = client.post("/chat", json={"message": question, "language": "en"})
+        assert resp.status_code == 200, resp.data
+
+    sizes = app.chat_model.prompt_tokens
+    print(f"🧾 {len(sizes)} turns, prompt tokens: first={sizes[0]} max={max(sizes)} last={sizes[-1]} "
+          f"(budget {app.CHAT_TOKEN_BUDGET})")
+    if max(sizes) > app.CHAT_TOKEN_BUDGET:
+        print("❌ prompt exceeded the token budget")
+        return 1
+    print("✅ prompt stayed within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# Measure what a first visit to the index page downloads, before and after build_assets.py,
+# and estimate load time on a throttled connection (Lighthouse's mobile profile: 1.6 Mbps
+# down, 150 ms RTT; one round trip for the HTML, one for the assets fetched in parallel).
+# Bytes are counted as sent, i.e. after br/gzip/WebP negotiation.
+#
+#   python bench/page_weight.py
+#
+# Rebuilds static/dist as a side effect, exactly as `python build_assets.py` does.
+import gzip
+import re
+import sys
+from urllib.parse import unquote
+
+from _app import app
+
+import build_assets
+
+BANDWIDTH_BPS = 1.6e6
+RTT = 0.150
+BROWSER_HEADERS = {
+    "Accept": "text/html,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Encoding": "gzip, deflate, br",
+}
+STATIC_URL = re.compile(r'(?:src|href)="(/static/[^"]+)"')
+
+
+def measure():
+    client = app.app.test_client()
+    page = client.get("/", headers=BROWSER_HEADERS)
+    html = page.get_data()
+    text = (gzip.decompress(html) if page.content_encoding == "gzip" else html).decode()
+    urls = sorted(set(STATIC_URL.findall(text)))
+    assets = 0
+    for url in urls:
+        resp = client.get(unquote(url), headers=BROWSER_HEADERS)
+        assert resp.status_code == 200, (url, resp.status_code)
+        assets += len(resp.get_data())
+        resp.close()
+    total = len(html) + assets
+    seconds = 2 * RTT + total * 8 / BANDWIDTH_BPS
+    return {"html": len(html), "assets": assets, "requests": len(urls) + 1, "total": total, "seconds": seconds}
+
+
+def main():
+    manifest = build_assets.build()
+    empty = {"assets": {}, "encodings": {}, "webp": {}}
+
+    app.asset_manifest = empty
+    before = measure()
+    app.asset_manifest = {**empty, **manifest}
+    after = measure()
+
+    for label, m in (("source assets", before), ("built assets", after)):
+        print(f"📊 {label:14} {m['requests']} requests, HTML {m['html'] / 1024:.0f} KiB + "
+              f"assets {m['assets'] / 1024:.0f} KiB = {m['total'] / 1024:.0f} KiB, ~{m['seconds']:.1f}s throttled")
+    if not after["total"] < before["total"]:
+        print("❌ built assets are not smaller")
+        return 1
+    print(f"✅ first-visit bytes down {100 * (1 - after['total'] / before['total']):.0f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# Load test for the /disease_detection admission control: one noisy client hammers the
+# endpoint from several threads while two quiet users upload every few seconds. YOLO is
+# replaced by a fake that takes 200 ms on a simulated 2-core CPU, so requests that get
+# past admission queue for the CPU just like real inference does.
+#
+#   python bench/rate_limit_load.py
+#
+# Runs twice, without and with the limiter, and prints p95 latency for the quiet users.
+# Quiet requests that get turned away count against the limiter: any rejection fails the run.
+import io
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from _app import app, logged_in_client
+
+DURATION = 9          # seconds per scenario
+NOISY_THREADS = 8
+QUIET_USERS = 6
+QUIET_INTERVAL = 3    # quiet users stay inside the default 3-request burst
+INFERENCE_SECONDS = 0.2
+cpu = threading.Semaphore(2)
+
+
+def fake_predict(path):
+    with cpu:
+        time.sleep(INFERENCE_SECONDS)
+    return {"class": "Healthy", "readable_class": "Healthy", "confidence": 99.0, "success": True}
+
+
+def upload(client):
+    data = {"image": (io.BytesIO(b"\xff\xd8\xff fake jpeg"), "leaf.jpg")}
+    start = time.monotonic()
+    resp = client.post("/disease_detection", data=data, content_type="multipart/form-data")
+    return resp.status_code, time.monotonic() - start
+
+
+def p95(values):
+    values = sorted(values)
+    return values[max(0, int(len(values) * 0.95) - 1)] if values else float("nan")
+
+
+def run_scenario():
+    stop = time.monotonic() + DURATION
+    quiet_latencies, quiet_rejected, noisy_status = [], [], []
+
+    def noisy():
+        client = logged_in_client("noisy")
+        while time.monotonic() < stop:
+            status, _ = upload(client)
+            noisy_status.append(status)
+            if status == 302:  # rate limited: redirected back to the form
+                time.sleep(0.01)
+
+    def quiet(user):
+        client = logged_in_client(user)
+        while time.monotonic() < stop:
+            status, latency = upload(client)
+            if status == 200:
+                quiet_latencies.append(latency)
+            else:  # 302 back to the form: own bucket empty or no inference slot in time
+                quiet_rejected.append(status)
+            time.sleep(QUIET_INTERVAL)
+
+    threads = [threading.Thread(target=noisy) for _ in range(NOISY_THREADS)]
+    threads += [threading.Thread(target=quiet, args=(f"quiet-{i}",)) for i in range(QUIET_USERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    served = sum(1 for s in noisy_status if s == 200)
+    return p95(quiet_latencies), len(quiet_latencies), len(quiet_rejected), served, len(noisy_status) - served
+
+
+@contextmanager
+def no_admission_control():
+    acquire, slots = app.rate_limiter.acquire, app.inference_slots.acquire
+    app.rate_limiter.acquire = lambda key, rate, burst: 0
+
+    @contextmanager
+    def no_slot(wait=None):
+        yield
+
+    app.inference_slots.acquire = no_slot
+    try:
+        yield
+    finally:
+        app.rate_limiter.acquire, app.inference_slots.acquire = acquire, slots
+
+
+def main():
+    app.predict_image = fake_predict
+    with no_admission_control():
+        before = run_scenario()
+    after = run_scenario()
+
+    for label, (quiet_p95, quiet_n, quiet_rejected, noisy_ok, noisy_rejected) in (
+            ("without limiter", before), ("with limiter", after)):
+        print(f"📊 {label:16} quiet p95={quiet_p95:.2f}s ({quiet_n} served, {quiet_rejected} rejected) | "
+              f"noisy served={noisy_ok} rejected={noisy_rejected}")
+    if after[2]:
+        print(f"❌ limiter turned away {after[2]} quiet-client requests")
+        return 1
+    if not after[0] < before[0]:
+        print("❌ limiter did not improve quiet-client p95")
+        return 1
+    print("✅ noisy client no longer degrades quiet-client p95")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
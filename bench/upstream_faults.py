@@ -0,0 +1,194 @@
+# Inject latency and failures into local stand-ins for Supabase, Visual Crossing and Google
+# Translate, and check the circuit breakers and fallbacks: open -> half-open -> closed,
+# stale weather when Visual Crossing is down, deferred history writes while Supabase is
+# down, per-request deadlines, and a translator that hangs without pinning threads.
+#
+#   python bench/upstream_faults.py
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from _stub import StubServer
+
+stub = StubServer()
+os.environ["SUPABASE_URL"] = stub.url
+os.environ.setdefault("BREAKER_FAILURES", "3")
+os.environ.setdefault("BREAKER_RESET", "1")
+os.environ.setdefault("TRANSLATOR_TIMEOUT", "1")
+os.environ.setdefault("SUPABASE_TIMEOUT", "2")
+
+import deep_translator.constants  # noqa: E402
+
+from _app import app, real_db_insert  # noqa: E402
+
+HANG = 30  # seconds a "hang" response takes; far longer than any timeout under test
+mode = {"supabase": "ok", "weather": "ok", "translate": "ok"}
+failures = []
+
+
+def fault(service):
+    """Apply the current mode for `service`; returns an error response, or None to answer normally."""
+    if mode[service] == "fail":
+        return 503, {"message": f"{service} is down"}
+    if mode[service] == "hang":
+        time.sleep(HANG)
+    return None
+
+
+def supabase_handler(method, path, query, body):
+    return fault("supabase") or (201, [body])
+
+
+def weather_handler(method, path, query, body):
+    start, end = (date.fromisoformat(p) for p in path.split("/")[-2:])
+    days = [{"datetime": str(start + timedelta(d)), "temp": 30, "humidity": 50, "precip": 1}
+            for d in range((end - start).days + 1)]
+    return fault("weather") or (200, {"days": days})
+
+
+def translate_handler(method, path, query, body):
+    return fault("translate") or (200, '<div class="t0">translated</div>')
+
+
+stub.route("/rest/v1/", supabase_handler)
+stub.route("/weather/", weather_handler)
+stub.route("/translate", translate_handler)
+app.WEATHER_URL = stub.url + "/weather/{city}/{start}/{end}?key={key}"
+deep_translator.constants.BASE_URLS["GOOGLE_TRANSLATE"] = stub.url + "/translate"
+
+
+def check(name, ok, detail=""):
+    print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def wait_for(condition, seconds=10):
+    stop = time.monotonic() + seconds
+    while time.monotonic() < stop:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def breaker_lifecycle():
+    breaker = app.weather_breaker
+    fetch = lambda: app.fetch_weather_days("Faultville", "key", "2024-01-01", "2024-01-03")  # noqa: E731
+
+    mode["weather"] = "fail"
+    for _ in range(app.BREAKER_FAILURES):
+        fetch()
+    hits = stub.hits["/weather/"]
+    check("breaker opens after consecutive failures", breaker.state == "open", breaker.state)
+    fetch()
+    check("open breaker fails fast without calling upstream", stub.hits["/weather/"] == hits)
+
+    time.sleep(app.BREAKER_RESET + 0.1)
+    fetch()
+    check("failed half-open probe re-opens the breaker",
+          breaker.state == "open" and stub.hits["/weather/"] == hits + 1, breaker.state)
+
+    time.sleep(app.BREAKER_RESET + 0.1)
+    mode["weather"] = "ok"
+    days = fetch()
+    check("successful half-open probe closes the breaker",
+          breaker.state == "closed" and days is not None and len(days) == 3, breaker.state)
+
+
+def stale_weather():
+    mode["weather"] = "fail"
+    stale = {"avg_temp": 21.5, "avg_humidity": 60.0, "total_rainfall": 80.0,
+             "timestamp": (datetime.now() - timedelta(days=2)).isoformat()}
+    app.weather_cache["Staleton"] = stale
+    result = app.get_weather_data("Staleton", "key")
+    check("stale weather served while Visual Crossing is down", result == (21.5, 60.0, 80.0), result)
+    result = app.get_weather_data("Nowhere", "key")
+    check("uncached city falls back to zeros", result == (0, 0, 0), result)
+    mode["weather"] = "ok"
+
+
+def deferred_writes():
+    breaker = app.supabase_breaker
+    written = app.deferred_stats["written"]
+
+    # A hung Supabase costs the request only what is left of its deadline
+    mode["supabase"] = "hang"
+    with app.app.test_request_context():
+        app.g.deadline = time.monotonic() + 0.5
+        start = time.monotonic()
+        result = real_db_insert("chat_logs", {"question": "deadline"})
+        elapsed = time.monotonic() - start
+    check("insert gives up at the request deadline", result is None and elapsed < 1.0, f"{elapsed:.2f}s")
+
+    # Down Supabase: rows are queued, the breaker opens and later writes skip the network
+    mode["supabase"] = "fail"
+    for i in range(app.BREAKER_FAILURES):
+        real_db_insert("chat_logs", {"question": f"down {i}"})
+    hits = stub.hits["/rest/v1/"]
+    real_db_insert("chat_logs", {"question": "while open"})
+    check("inserts fail fast while the breaker is open",
+          breaker.state == "open" and stub.hits["/rest/v1/"] == hits, breaker.state)
+    check("failed inserts are queued", len(app.deferred_writes) == app.BREAKER_FAILURES + 2,
+          f"{len(app.deferred_writes)} pending")
+
+    mode["supabase"] = "ok"
+    drained = wait_for(lambda: not app.deferred_writes)
+    written = app.deferred_stats["written"] - written
+    stored = [q for m, p, q in stub.requests if m == "POST"]
+    check("queued rows are written once Supabase recovers",
+          drained and written == app.BREAKER_FAILURES + 2 and breaker.state == "closed",
+          f"{written} written, breaker {breaker.state}, {len(stored)} POSTs")
+
+
+def hung_translator():
+    breaker = app.translator_breaker
+    mode["translate"] = "hang"
+    results = []
+
+    def call():
+        start = time.monotonic()
+        results.append((app.translate_to_english("salaam", "ur"), time.monotonic() - start))
+
+    threads = [threading.Thread(target=call) for _ in range(app.TIMEOUT_THREADS + 4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    slowest = max(elapsed for _, elapsed in results)
+    check("hung translator falls back to the original text within its timeout",
+          all(text == "salaam" for text, _ in results) and slowest < breaker.timeout + 1, f"slowest {slowest:.2f}s")
+
+    def threads_released():
+        taken = 0
+        while app.timeout_slots.acquire(blocking=False):
+            taken += 1
+        for _ in range(taken):
+            app.timeout_slots.release()
+        return taken == app.TIMEOUT_THREADS
+
+    check("hung calls release their threads at the socket timeout", wait_for(threads_released, HANG / 3))
+
+    mode["translate"] = "ok"
+    time.sleep(app.BREAKER_RESET + 0.1)
+    text = app.translate_to_english("salaam", "ur")
+    check("translator breaker closes after the hang", text == "translated" and breaker.state == "closed",
+          f"{text!r}, breaker {breaker.state}")
+
+
+def main():
+    breaker_lifecycle()
+    stale_weather()
+    deferred_writes()
+    hung_translator()
+    if failures:
+        print(f"❌ {len(failures)} checks failed")
+        return 1
+    print("✅ breakers and fallbacks behave under injected faults")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# Serve synthetic days from a local Visual Crossing stub and check the per-city daily store:
+# the first fetch downloads the whole window, the next one only re-fetches the last stored
+# day, a larger WEATHER_WINDOW_DAYS backfills the older days, and the averages match the
+# synthetic data for exactly the days inside the window.
+#
+#   python bench/weather_store.py
+import math
+import sys
+from datetime import date, timedelta
+
+from _stub import StubServer
+from _app import app
+
+CITY = "Stubabad, PK"
+fetches = []  # (start, end) of every range requested
+
+
+def synthetic_day(day):
+    n = day.toordinal()
+    return {"datetime": str(day), "temp": 10 + n % 25, "humidity": 40 + n % 50, "precip": n % 4}
+
+
+def weather_handler(method, path, query, body):
+    start, end = (date.fromisoformat(p) for p in path.split("/")[-2:])
+    fetches.append((start, end))
+    return 200, {"days": [synthetic_day(start + timedelta(d)) for d in range((end - start).days + 1)]}
+
+
+def expected(window_days):
+    today = date.today()
+    days = [synthetic_day(today - timedelta(d)) for d in range(window_days + 1)]
+    return (sum(d["temp"] for d in days) / len(days),
+            sum(d["humidity"] for d in days) / len(days),
+            float(sum(d["precip"] for d in days)))
+
+
+def close(result, want):
+    return result is not None and all(math.isclose(a, b) for a, b in zip(result, want))
+
+
+def main():
+    stub = StubServer()
+    stub.route("/weather/", weather_handler)
+    app.WEATHER_URL = stub.url + "/weather/{city}/{start}/{end}?key={key}"
+    today = date.today()
+    window = app.WEATHER_WINDOW_DAYS
+    failures = []
+
+    def check(name, ok, detail):
+        print(f"{'✅' if ok else '❌'} {name} ({detail})")
+        if not ok:
+            failures.append(name)
+
+    result = app.fetch_weather_data(CITY, "key")
+    start, end = fetches[-1]
+    check("first fetch downloads the whole window",
+          (start, end) == (today - timedelta(window), today), f"{start} → {end}, {(end - start).days + 1} days")
+    check("window averages match the synthetic days", close(result, expected(window)), result)
+
+    result = app.fetch_weather_data(CITY, "key")
+    start, end = fetches[-1]
+    check("second fetch only re-fetches the last stored day", start == end == today, f"{start} → {end}")
+    check("averages unchanged after the incremental fetch", close(result, expected(window)), result)
+
+    larger = window + 30
+    result = app.fetch_weather_data(CITY, "key", window_days=larger)
+    start, end = fetches[-1]
+    check("larger window backfills from its new start",
+          (start, end) == (today - timedelta(larger), today), f"{start} → {end}")
+    check("larger window averages match", close(result, expected(larger)), result)
+
+    result = app.fetch_weather_data(CITY, "key")
+    store = app.load_weather_store(CITY)
+    check("shrinking back trims the store to the window",
+          len(store["day"]) == window + 1 and close(result, expected(window)), f"{len(store['day'])} days stored")
+
+    cached = app.weather_cache[CITY]
+    check("averages are cached for the city",
+          close((cached["avg_temp"], cached["avg_humidity"], cached["total_rainfall"]), expected(window)), cached)
+
+    if failures:
+        print(f"❌ {len(failures)} checks failed")
+        return 1
+    print("✅ daily store fetches only missing days and averages the window")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# ---------------- STATIC ASSET BUILD ----------------
+# Run before deploying:  python build_assets.py
+#
+# Writes fingerprinted copies of everything under static/css, static/js, static/images
+# and static/image into static/dist, plus:
+#   - precompressed .gz / .br variants of text assets
+#   - resized .webp variants of the hero and crop images
+#   - static/dist/manifest.json, which app.py uses to rewrite url_for('static', ...)
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = "static"
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+SOURCE_DIRS = ["css", "js", "images", "image"]
+TEXT_EXTENSIONS = {".css", ".js", ".svg", ".json"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+WEBP_MAX_WIDTH = {"images": 1600, "image": 800}  # hero images vs. crop thumbnails
+WEBP_QUALITY = 80
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:10]
+
+
+def compress_variants(path):
+    """Write .gz (and .br if brotli is installed) next to `path`. Returns the encodings written."""
+    with open(path, "rb") as f:
+        data = f.read()
+    encodings = []
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+        encodings.append("br")
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    encodings.append("gzip")
+    return encodings
+
+
+def webp_variant(src, dest, max_width):
+    img = Image.open(src)
+    if img.width > max_width:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    img.save(dest, "WEBP", quality=WEBP_QUALITY, method=6)
+
+
+def build():
+    if os.path.exists(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = {"assets": {}, "encodings": {}, "webp": {}}
+    for source_dir in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(STATIC_DIR, source_dir)):
+            for name in sorted(files):
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, STATIC_DIR).replace(os.sep, "/")
+                stem, ext = os.path.splitext(rel)
+                fingerprinted = f"dist/{stem}.{file_hash(src)}{ext}"
+                dest = os.path.join(STATIC_DIR, fingerprinted)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copyfile(src, dest)
+                manifest["assets"][rel] = fingerprinted
+
+                if ext.lower() in TEXT_EXTENSIONS:
+                    manifest["encodings"][fingerprinted] = compress_variants(dest)
+                elif ext.lower() in IMAGE_EXTENSIONS:
+                    webp = os.path.splitext(fingerprinted)[0] + ".webp"
+                    webp_variant(src, os.path.join(STATIC_DIR, webp), WEBP_MAX_WIDTH[source_dir])
+                    manifest["webp"][fingerprinted] = webp
+
+    with open(os.path.join(DIST_DIR, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"📦 Built {len(manifest['assets'])} assets "
+          f"({len(manifest['encodings'])} precompressed, {len(manifest['webp'])} WebP) into {DIST_DIR}")
+    if brotli is None:
+        print("⚠️ brotli not installed, only gzip variants were written")
+    return manifest
+
+
+if __name__ == "__main__":
+    build()